@@ -4,6 +4,9 @@ import os
 import time
 from pathlib import Path
 
+from chat_model import Analysis, Checkpoint, MessageLog, Session, dump_sessions
+from customer_rollup import CustomerRollup
+
 # ================= 配置区域 =================
 SOURCE_FOLDER = "data"
 OUTPUT_FOLDER = os.path.join("source", "processed_result")
@@ -146,7 +149,8 @@ def check_user_risk(content):
             
     return None
 
-def analyze_chat_logic(messages):
+def analyze_chat_log(log):
+    """核心分析逻辑：遍历紧凑消息模型 (MessageLog)，返回 Analysis"""
     checkpoints = []
     highlight_indices = []
     total_deduction = 0
@@ -154,13 +158,13 @@ def analyze_chat_logic(messages):
     # 辅助逻辑：计算客服说“抱歉”的次数，如果太多，说明客服被逼急了，也是风险
     apology_count = 0 
     
-    for idx, msg in enumerate(messages):
+    for idx in range(len(log)):
+        sender, msg_type, content = log.row(idx)
         # 【修改】忽略系统消息
-        if msg.get('type') == 'system':
+        if msg_type == 'system':
             continue
 
-        content = msg.get('content', '').strip()
-        sender = msg.get('sender', '')
+        content = content.strip()
         if not content: continue
         
         risk_item = None
@@ -175,12 +179,8 @@ def analyze_chat_logic(messages):
             risk_item = check_user_risk(content)
             
         if risk_item:
-            checkpoints.append({
-                "point": risk_item['point'],
-                "type": risk_item['type'],
-                "reason": risk_item['reason'],
-                "text": content
-            })
+            # text 通过消息下标引用原文
+            checkpoints.append(Checkpoint(risk_item['point'], risk_item['type'], risk_item['reason'], idx))
             if idx not in highlight_indices:
                 highlight_indices.append(idx)
             
@@ -192,25 +192,28 @@ def analyze_chat_logic(messages):
     # 【新增逻辑】如果客服道歉超过4次，判定为潜在服务风险（即使没违规）
     if apology_count >= 4 and total_deduction == 0:
         total_deduction += 20
-        checkpoints.append({
-            "point": 20,
-            "type": "服务预警",
-            "reason": "客服频繁道歉(>3次)，可能存在处理困难",
-            "text": "(全局检测)"
-        })
+        checkpoints.append(Checkpoint(20, "服务预警", "客服频繁道歉(>3次)，可能存在处理困难", text="(全局检测)"))
 
     final_score = max(0, 100 - total_deduction)
     is_risk = len(checkpoints) > 0
     
-    return {
-        "score": final_score,
-        "is_risk": is_risk,
-        "summary": f"发现 {len(checkpoints)} 处异常" if is_risk else "",
-        "checkpoints": checkpoints,
-        "highlight_indices": highlight_indices
-    }
+    return Analysis.build(
+        log,
+        score=final_score,
+        is_risk=is_risk,
+        summary=f"发现 {len(checkpoints)} 处异常" if is_risk else "",
+        checkpoints=checkpoints,
+        highlight_indices=highlight_indices
+    )
 
-def process_single_file(file_path, output_path):
+def analyze_chat_logic(messages):
+    """兼容旧接口：接收消息 dict 列表 (或 MessageLog)，返回 dict 结果"""
+    if not isinstance(messages, MessageLog):
+        messages = MessageLog.from_list(messages)
+    return analyze_chat_log(messages).to_dict()
+
+def process_single_file(file_path, output_path, rollup=None):
+    """rollup 中只能包含该日之前的数据，否则重复投诉标记会受到之后日期的影响"""
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             raw_data = json.load(f)
@@ -219,29 +222,43 @@ def process_single_file(file_path, output_path):
         
         print(f"  > 正在分析 {file_path.name} (共 {len(raw_data)} 条对话)...")
 
-        for item in raw_data:
-            item = standardize_data(item)
+        # 逐条转换为紧凑模型，转换后立即释放原始 dict
+        raw_data.reverse()
+        while raw_data:
+            session = Session.from_dict(standardize_data(raw_data.pop()))
+            
+            ai_result = analyze_chat_log(session.messages)
             
-            ai_result = analyze_chat_logic(item.get('messages', []))
+            # 累计到客户汇总 (每个会话都计入，与是否保存无关)
+            if rollup is not None:
+                rollup.update(session, file_path.stem, ai_result)
             
-            if ONLY_SAVE_RISK_ITEMS and not ai_result['is_risk']:
+            if ONLY_SAVE_RISK_ITEMS and not ai_result.is_risk:
                 continue
                 
-            if ai_result['is_risk']:
+            if ai_result.is_risk:
                 # 打印出命中的原因，方便您确认这次是否抓到了
-                reasons = [cp['reason'] for cp in ai_result['checkpoints']]
+                reasons = [cp.reason for cp in ai_result.checkpoints]
                 # 注意：这里的扣分显示的是 total_deduction，如果只是用户投诉，扣分可能为0，但会有原因显示
-                print(f"    [命中] ID:{item.get('id')} 扣分:{100-ai_result['score']} 原因:{reasons}")
+                print(f"    [命中] ID:{session.id} 扣分:{100-ai_result.score} 原因:{reasons}")
+
+            session['ai_analysis'] = ai_result
+            processed_data.append(session)
 
-            item['ai_analysis'] = ai_result
-            processed_data.append(item)
+        # 当天全部会话计入汇总后再打标记，结果与同一天内的处理顺序无关
+        # 标记只反映截至当天的状态：客户之后才达到阈值时，之前各天的结果不会回溯修改
+        if rollup is not None:
+            for session in processed_data:
+                customer = rollup.find(str(session.id))
+                if customer and customer['repeat']:
+                    session.ai_analysis['repeat_customer'] = True
+                    session.ai_analysis['customer_risk_days'] = customer['risk_days']
 
         if not processed_data: 
             print("    [提示] 无风险对话，跳过。")
             return True
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(processed_data, f, ensure_ascii=False, indent=2)
+        dump_sessions(processed_data, output_path)
         print(f"    [完成] 已生成: {output_path}")
         return True
     except Exception as e:
@@ -250,15 +267,18 @@ def process_single_file(file_path, output_path):
 
 def run_batch_job():
     if not os.path.exists(OUTPUT_FOLDER): os.makedirs(OUTPUT_FOLDER)
-    files = list(Path(SOURCE_FOLDER).glob("*.json"))
+    # 按日期顺序处理，客户汇总每次从零开始累计，与时间线一致
+    files = sorted(Path(SOURCE_FOLDER).glob("*.json"))
+    rollup = CustomerRollup()
     print(f"开始 v4.2 分析 (新增信任/时效投诉检测)...")
     
     count = 0
     for f in files:
         if "_analyzed" in f.name: continue
         output_path = os.path.join(OUTPUT_FOLDER, f.name)
-        if process_single_file(f, output_path):
+        if process_single_file(f, output_path, rollup):
             count += 1
+        rollup.save()
             
     print(f"任务全部完成。")
 
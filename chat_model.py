@@ -0,0 +1,407 @@
+import json
+import re
+import sys
+import tracemalloc
+from array import array
+from pathlib import Path
+
+# ================= 紧凑内存模型 =================
+# 会话 / 消息 / 风险点 的 __slots__ 表示，用于替代嵌套 dict。
+# - 消息按列存储：时间(当日分钟数) / 发送者编码 / 类型编码 / 内容
+# - sender、type 使用全局词表编码，重复字符串只存一份
+# - 风险点通过消息下标引用原文，不再重复保存 text
+# - from_dict / to_dict 与现有 JSON 结构互转，保证无损（含字段顺序）
+
+_MISSING = object()
+
+
+class _Vocab:
+    """字符串 <-> 小整数编码表 (最多 256 项，超出的值按非标准消息原样保留)"""
+    __slots__ = ('values', 'codes')
+
+    def __init__(self, initial):
+        self.values = []
+        self.codes = {}
+        for value in initial:
+            self.code(value)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            if not isinstance(value, str) or len(self.values) >= 256:
+                return None
+            value = sys.intern(value)
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+
+SENDERS = _Vocab(('Service', 'User', 'System'))
+MSG_TYPES = _Vocab(('text', 'system', 'image'))
+
+# 相同的字段顺序共用同一个 tuple
+_KEY_ORDERS = {}
+
+
+def _intern_keys(keys):
+    keys = tuple(keys)
+    return _KEY_ORDERS.setdefault(keys, keys)
+
+
+def _intern_str(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# ================= 时间编码 =================
+
+_TIME_RE = re.compile(r"([0-9]{2}):([0-9]{2})(?::([0-9]{2}))?")
+
+
+def parse_time(value):
+    """'HH:MM' / 'HH:MM:SS' -> (当日分钟数, 秒)；无秒为 -1，空字符串为 (-1, -1)；无法无损还原时返回 None"""
+    if value == '':
+        return -1, -1
+    if isinstance(value, str):
+        match = _TIME_RE.fullmatch(value)
+        if match:
+            hour, minute = int(match.group(1)), int(match.group(2))
+            second = int(match.group(3)) if match.group(3) else -1
+            if hour < 24 and minute < 60 and second < 60:
+                return hour * 60 + minute, second
+    return None
+
+
+def format_time(minutes, second=-1):
+    """当日分钟数 (+秒) -> 'HH:MM' / 'HH:MM:SS'"""
+    if minutes < 0:
+        return ''
+    if second < 0:
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+    return f"{minutes // 60:02d}:{minutes % 60:02d}:{second:02d}"
+
+
+# ================= 消息 =================
+
+_MESSAGE_KEYS = ('time', 'sender', 'content', 'type')
+
+
+class MessageLog:
+    """按列存储的消息列表"""
+    __slots__ = ('times', 'seconds', 'senders', 'types', 'contents', 'irregular')
+
+    def __init__(self):
+        self.times = array('h')
+        # 原始数据带秒时才创建，-1 表示该条只有 'HH:MM'
+        self.seconds = None
+        self.senders = array('B')
+        self.types = array('B')
+        self.contents = []
+        # 下标 -> 原始消息，存放无法按列编码的消息 (如 '9:00' 这类时间)
+        self.irregular = None
+
+    @classmethod
+    def from_list(cls, messages):
+        log = cls()
+        for msg in messages:
+            log.append(msg)
+        return log
+
+    def append(self, msg):
+        parsed = sender = msg_type = None
+        if isinstance(msg, dict) and tuple(msg) == _MESSAGE_KEYS and isinstance(msg['content'], str):
+            parsed = parse_time(msg['time'])
+            sender = SENDERS.code(msg['sender'])
+            msg_type = MSG_TYPES.code(msg['type'])
+
+        if parsed is None or sender is None or msg_type is None:
+            if self.irregular is None:
+                self.irregular = {}
+            self.irregular[len(self.contents)] = msg
+            minutes, second, sender, msg_type, content = -1, -1, 0, 0, ''
+        else:
+            minutes, second = parsed
+            content = msg['content']
+
+        if second >= 0 and self.seconds is None:
+            self.seconds = array('b', [-1]) * len(self.contents)
+        if self.seconds is not None:
+            self.seconds.append(second)
+        self.times.append(minutes)
+        self.senders.append(sender)
+        self.types.append(msg_type)
+        self.contents.append(content)
+
+    def __len__(self):
+        return len(self.contents)
+
+    def row(self, idx):
+        """返回 (sender, type, content)，供分析逻辑逐条遍历"""
+        if self.irregular and idx in self.irregular:
+            msg = self.irregular[idx]
+            if not isinstance(msg, dict):
+                return '', None, ''
+            return msg.get('sender', ''), msg.get('type'), msg.get('content', '')
+        return SENDERS.values[self.senders[idx]], MSG_TYPES.values[self.types[idx]], self.contents[idx]
+
+    def message(self, idx):
+        """还原为原始的消息 dict"""
+        if self.irregular and idx in self.irregular:
+            return self.irregular[idx]
+        return {
+            "time": format_time(self.times[idx], self.seconds[idx] if self.seconds is not None else -1),
+            "sender": SENDERS.values[self.senders[idx]],
+            "content": self.contents[idx],
+            "type": MSG_TYPES.values[self.types[idx]],
+        }
+
+    def to_list(self):
+        return [self.message(idx) for idx in range(len(self.contents))]
+
+
+# ================= 风险点 =================
+
+_CHECKPOINT_KEYS = ('point', 'type', 'reason', 'text')
+
+
+class Checkpoint:
+    """单个风险点；index >= 0 时 text 由对应消息内容推导"""
+    __slots__ = ('point', 'type', 'reason', 'index', 'text')
+
+    def __init__(self, point, type, reason, index=-1, text=None):
+        self.point = point
+        self.type = _intern_str(type)
+        self.reason = _intern_str(reason)
+        self.index = index
+        self.text = text
+
+    def get_text(self, log):
+        if self.index >= 0:
+            return log.row(self.index)[2].strip()
+        return self.text
+
+    def to_dict(self, log):
+        return {
+            "point": self.point,
+            "type": self.type,
+            "reason": self.reason,
+            "text": self.get_text(log),
+        }
+
+
+def _pack_checkpoints(checkpoints, highlight_indices, log):
+    """风险点与 highlight_indices 按顺序一一对应，能对上原文的改为下标引用"""
+    if not isinstance(checkpoints, list):
+        return checkpoints
+    packed = []
+    cursor = 0
+    for cp in checkpoints:
+        if not (isinstance(cp, dict) and tuple(cp) == _CHECKPOINT_KEYS):
+            packed.append(cp)
+            continue
+        index = -1
+        if log is not None and cursor < len(highlight_indices):
+            candidate = highlight_indices[cursor]
+            if 0 <= candidate < len(log) and log.row(candidate)[2].strip() == cp['text']:
+                index = candidate
+                cursor += 1
+        packed.append(Checkpoint(cp['point'], cp['type'], cp['reason'], index,
+                                 None if index >= 0 else cp['text']))
+    return packed
+
+
+def _pack_indices(indices):
+    if isinstance(indices, list) and all(type(i) is int and 0 <= i < 2 ** 31 for i in indices):
+        return array('i', indices)
+    return indices
+
+
+# ================= 通用记录 =================
+
+class _Record:
+    """带固定字段的 __slots__ 记录，支持 dict 风格读写，字段顺序按原 JSON 保留"""
+    __slots__ = ('_keys', 'extra')
+    FIELDS = ()
+
+    def __init__(self):
+        self._keys = ()
+        self.extra = None
+        for field in self.FIELDS:
+            setattr(self, field, None)
+
+    def _pack(self, key, value):
+        return value
+
+    def _unpack(self, key, value):
+        return value
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def get(self, key, default=None):
+        if key not in self._keys:
+            return default
+        if key in self.FIELDS:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, self._pack(key, value))
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        if key not in self._keys:
+            self._keys = _intern_keys(self._keys + (key,))
+
+    def keys(self):
+        return self._keys
+
+    def to_dict(self):
+        return {key: self._unpack(key, self.get(key)) for key in self._keys}
+
+
+class Analysis(_Record):
+    """ai_analysis 字段"""
+    FIELDS = ('score', 'is_risk', 'summary', 'checkpoints', 'highlight_indices',
+              'review_status', 'manual_reviewed', 'original_score',
+              'repeat_customer', 'customer_risk_days')
+    __slots__ = FIELDS + ('log',)
+
+    def __init__(self, log=None):
+        super().__init__()
+        self.log = log
+
+    @classmethod
+    def build(cls, log, score, is_risk, summary, checkpoints, highlight_indices):
+        analysis = cls(log)
+        analysis.score = score
+        analysis.is_risk = is_risk
+        analysis.summary = _intern_str(summary)
+        analysis.checkpoints = checkpoints
+        analysis.highlight_indices = array('i', highlight_indices)
+        analysis._keys = _intern_keys(('score', 'is_risk', 'summary', 'checkpoints', 'highlight_indices'))
+        return analysis
+
+    @classmethod
+    def from_dict(cls, data, log=None):
+        analysis = cls(log)
+        indices = data.get('highlight_indices')
+        for key, value in data.items():
+            if key == 'checkpoints':
+                value = _pack_checkpoints(value, indices if isinstance(indices, list) else [], log)
+            analysis[key] = value
+        return analysis
+
+    def _pack(self, key, value):
+        if key == 'highlight_indices':
+            return _pack_indices(value)
+        if key == 'summary':
+            return _intern_str(value)
+        return value
+
+    def _unpack(self, key, value):
+        if key == 'checkpoints' and isinstance(value, list):
+            return [cp.to_dict(self.log) if isinstance(cp, Checkpoint) else cp for cp in value]
+        if key == 'highlight_indices' and isinstance(value, array):
+            return value.tolist()
+        return value
+
+
+class Session(_Record):
+    """单个会话"""
+    FIELDS = ('info', 'date', 'messages', 'id', 'customer_name', 'last_time', 'ai_analysis')
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_dict(cls, item):
+        session = cls()
+        # 先处理 messages，ai_analysis 需要引用消息原文
+        messages = item.get('messages')
+        log = MessageLog.from_list(messages) if isinstance(messages, list) else None
+        for key, value in item.items():
+            if key == 'messages' and log is not None:
+                value = log
+            elif key == 'ai_analysis' and isinstance(value, dict):
+                value = Analysis.from_dict(value, log)
+            session[key] = value
+        return session
+
+    def _pack(self, key, value):
+        if key in ('date', 'last_time', 'customer_name'):
+            return _intern_str(value)
+        if key == 'ai_analysis' and isinstance(value, dict):
+            return Analysis.from_dict(value, self.messages if isinstance(self.messages, MessageLog) else None)
+        return value
+
+    def _unpack(self, key, value):
+        if isinstance(value, MessageLog):
+            return value.to_list()
+        if isinstance(value, Analysis):
+            return value.to_dict()
+        return value
+
+
+# ================= 文件读写 =================
+
+def load_sessions(file_path):
+    """读取一天的 JSON 文件并转换为紧凑模型"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        raw_data = json.load(f)
+    if not isinstance(raw_data, list):
+        raw_data = [raw_data]
+    return [Session.from_dict(item) for item in raw_data]
+
+
+def dump_sessions(sessions, file_path):
+    """按原 JSON 格式写回"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump([s.to_dict() for s in sessions], f, ensure_ascii=False, indent=2)
+
+
+# ================= 内存测量 =================
+
+def measure_memory(file_paths):
+    """分别统计 dict 形式与紧凑模型常驻内存 (tracemalloc)，并校验无损往返"""
+    results = []
+    for file_path in file_paths:
+        text = Path(file_path).read_text(encoding='utf-8')
+
+        tracemalloc.start()
+        raw_data = json.loads(text)
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        sessions = [Session.from_dict(item) for item in json.loads(text)]
+        compact_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        lossless = json.dumps([s.to_dict() for s in sessions], ensure_ascii=False) == \
+            json.dumps(raw_data, ensure_ascii=False)
+        results.append((Path(file_path).name, len(text.encode('utf-8')), dict_bytes, compact_bytes, lossless))
+        del raw_data, sessions
+    return results
+
+
+if __name__ == "__main__":
+    folders = sys.argv[1:] or [str(Path("source") / "processed_result")]
+    paths = sorted(p for folder in folders for p in Path(folder).glob("*.json"))
+    total_file = total_dict = total_compact = 0
+    print(f"{'文件':<18}{'JSON大小':>12}{'dict':>12}{'紧凑模型':>12}{'比例':>8}  无损")
+    for name, file_bytes, dict_bytes, compact_bytes, lossless in measure_memory(paths):
+        total_file += file_bytes
+        total_dict += dict_bytes
+        total_compact += compact_bytes
+        print(f"{name:<18}{file_bytes:>12,}{dict_bytes:>12,}{compact_bytes:>12,}"
+              f"{compact_bytes / dict_bytes:>8.1%}  {'OK' if lossless else 'FAIL'}")
+    if paths:
+        print(f"{'合计':<18}{total_file:>12,}{total_dict:>12,}{total_compact:>12,}"
+              f"{total_compact / total_dict:>8.1%}")
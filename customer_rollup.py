@@ -0,0 +1,302 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+from chat_model import Checkpoint, MessageLog, format_time, load_sessions
+
+# ================= 配置区域 =================
+# 客户累计风险汇总文件 (与 processed_result 同级)
+ROLLUP_FILE = os.path.join("source", "customer_rollup.json")
+RESULT_FOLDER = os.path.join("source", "processed_result")
+
+# 命中用户风险的不同天数达到该值即视为重复投诉客户
+REPEAT_THRESHOLD = 3
+
+UNKNOWN_CUSTOMER = "未知客户"
+
+# 客户身份：会话 ID 每天都会变，姓名是 "黄*" 这类脱敏姓氏，都不能用来识别同一个人。
+# 以下任一关联键相同的会话归为同一客户 (同一客户的会话会被重复抓取到不同的会话 ID 下)：
+# - 订单号：订单只属于一个买家
+# - 用户风险消息指纹：同一条用户消息 (时间 + 内容)
+# - 历史开头：前 HEAD_USER_MESSAGES 条用户消息 (时间 + 内容) 完全一致
+_ORDER_RE = re.compile(r"订单(?:编号|号)[：:]?\s*([0-9]{15,})")
+HEAD_USER_MESSAGES = 3
+
+# ================= 单会话统计 =================
+
+def order_numbers(log):
+    """会话中出现的全部订单号"""
+    orders = set()
+    if isinstance(log, MessageLog):
+        for idx in range(len(log)):
+            content = log.row(idx)[2]
+            if isinstance(content, str) and '订单' in content:
+                orders.update(_ORDER_RE.findall(content))
+    return sorted(orders)
+
+def checkpoint_label(reason):
+    """'疑似[威胁投诉/升级]' -> '威胁投诉/升级'，没有方括号时原样返回"""
+    match = re.search(r"\[(.+?)\]", reason or '')
+    return match.group(1) if match else reason
+
+def user_risks(analysis, log):
+    """
+    由用户消息触发的风险点：{消息指纹: 标签}
+    抓取时每天都会带上完整的历史聊天，同一条消息会出现在多个会话里，
+    用 (时间, 内容) 做指纹，同一客户下只计一次
+    """
+    risks = {}
+    if not analysis or not isinstance(log, MessageLog):
+        return risks
+    for cp in analysis.get('checkpoints') or []:
+        if not isinstance(cp, Checkpoint) or cp.index < 0:
+            continue
+        sender, _, content = log.row(cp.index)
+        if sender != 'User':
+            continue
+        risks[_fingerprint(log.times[cp.index], content)] = checkpoint_label(cp.reason)
+    return risks
+
+def _fingerprint(minutes, content):
+    return hashlib.md5(f"{minutes}|{content.strip()}".encode('utf-8')).hexdigest()[:16]
+
+def history_head(log):
+    """前几条用户消息的指纹，重复抓取的同一段聊天开头相同；用户消息不足时返回 None"""
+    parts = []
+    if isinstance(log, MessageLog):
+        for idx in range(len(log)):
+            if log.times[idx] < 0:
+                continue
+            sender, msg_type, content = log.row(idx)
+            if sender == 'User' and msg_type != 'system' and content.strip():
+                parts.append(_fingerprint(log.times[idx], content))
+                if len(parts) == HEAD_USER_MESSAGES:
+                    return hashlib.md5("|".join(parts).encode('utf-8')).hexdigest()[:16]
+    return None
+
+def message_time_range(log):
+    """第一条 / 最后一条带时间的消息的 'HH:MM' (直接读时间列，跳过空时间和非标准时间)"""
+    if not isinstance(log, MessageLog):
+        return '', ''
+    valid = [minutes for minutes in log.times if minutes >= 0]
+    return (format_time(valid[0]), format_time(valid[-1])) if valid else ('', '')
+
+def link_keys(orders, risks, head):
+    """会话的全部关联键"""
+    links = [f"order:{order}" for order in orders]
+    links.extend(f"risk:{fingerprint}" for fingerprint in sorted(risks))
+    if head:
+        links.append(f"head:{head}")
+    return links
+
+# ================= 客户汇总 =================
+
+def _recompute(record):
+    """根据该客户名下各会话的贡献重新计算汇总字段 (只涉及这一个客户)"""
+    sessions = sorted(record['sessions'].values(), key=lambda s: (s['date'], s['start']))
+    # 人工审核判定为误报 (approved) 的会话，其风险消息在该客户名下全部不计 (含重复抓取的副本)
+    dismissed = set()
+    for s in sessions:
+        if s['dismissed']:
+            dismissed.update(s['risks'])
+    first_seen = {}
+    labels = {}
+    risk_days = set()
+    series = []
+    orders = set()
+    for s in sessions:
+        orders.update(s['orders'])
+        new_risks = 0
+        for fingerprint, label in s['risks'].items():
+            if fingerprint in first_seen or fingerprint in dismissed:
+                continue
+            # 重复抓取的历史消息按最早出现的日期计
+            first_seen[fingerprint] = s['date']
+            labels[label] = labels.get(label, 0) + 1
+            risk_days.add(s['date'])
+            new_risks += 1
+        series.append(new_risks)
+
+    # 趋势：最近一次会话新增的用户风险数与此前的平均值比较
+    if len(series) < 2:
+        trend = 'new'
+    else:
+        previous = sum(series[:-1]) / (len(series) - 1)
+        trend = 'up' if series[-1] > previous else 'down' if series[-1] < previous else 'flat'
+
+    record['orders'] = sorted(orders)
+    record['identified'] = bool(orders)
+    record['session_count'] = len(sessions)
+    record['risk_session_count'] = sum(1 for n in series if n)
+    record['risk_days'] = len(risk_days)
+    record['risk_total'] = len(first_seen)
+    record['labels'] = labels
+    record['first_contact'] = f"{sessions[0]['date']} {sessions[0]['start']}".strip()
+    record['last_contact'] = f"{sessions[-1]['date']} {sessions[-1]['end']}".strip()
+    record['trend'] = trend
+    record['repeat'] = record['risk_days'] >= REPEAT_THRESHOLD
+
+class CustomerRollup:
+    """
+    按客户累计的风险汇总
+    - update() 在每个会话分析完成后调用，只重算相关客户的记录
+    - 同一会话重复 update 时覆盖旧的贡献，不会重复计数
+    - 新会话通过关联键同时关联到多个已有客户时，合并为一个客户
+    - get() / find() 为字典查找，top() 使用懒计算的排名缓存
+    """
+
+    def __init__(self, path=ROLLUP_FILE):
+        self.path = path
+        self.customers = {}
+        # 会话 ID / 关联键 (order:/risk:/head:) -> 客户标识
+        self._session_index = {}
+        self._link_index = {}
+        self._ranking = None
+
+    @classmethod
+    def load(cls, path=ROLLUP_FILE):
+        rollup = cls(path)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                rollup.customers = json.load(f).get('customers', {})
+            for key, record in rollup.customers.items():
+                rollup._index(key, record)
+        return rollup
+
+    def save(self):
+        """先写临时文件再替换，避免写到一半时服务端读到残缺文件"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"repeat_threshold": REPEAT_THRESHOLD, "customers": self.customers},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _index(self, key, record):
+        for s in record['sessions'].values():
+            self._session_index[s['id']] = key
+            for link in s['links']:
+                self._link_index[link] = key
+
+    def _detach(self, session_id):
+        """移除某会话之前的贡献"""
+        key = self._session_index.pop(session_id, None)
+        record = self.customers.get(key)
+        if record is None:
+            return
+        for session_key in [k for k, s in record['sessions'].items() if s['id'] == session_id]:
+            for link in record['sessions'].pop(session_key)['links']:
+                if self._link_index.get(link) == key:
+                    del self._link_index[link]
+        if record['sessions']:
+            _recompute(record)
+            self._index(key, record)
+        else:
+            del self.customers[key]
+
+    def update(self, session, date_str, analysis=None):
+        """累加一个已分析会话，返回 (客户标识, 该客户的最新汇总)"""
+        if analysis is None:
+            analysis = session.get('ai_analysis')
+        log = session.get('messages')
+        session_id = str(session.get('id'))
+        orders = order_numbers(log)
+        risks = user_risks(analysis, log)
+        links = link_keys(orders, risks, history_head(log))
+
+        self._detach(session_id)
+
+        keys = []
+        for link in links:
+            key = self._link_index.get(link)
+            if key and key not in keys:
+                keys.append(key)
+        if keys:
+            # 关联到多个客户时，以最早接触的那个为准合并
+            keys.sort(key=lambda k: self.customers[k]['first_contact'])
+            key = keys[0]
+            record = self.customers[key]
+            for other in keys[1:]:
+                merged = self.customers.pop(other)
+                record['sessions'].update(merged['sessions'])
+        else:
+            key = f"订单:{orders[0]}" if orders else session_id
+            record = {"customer_name": session.get('customer_name', UNKNOWN_CUSTOMER), "sessions": {}}
+            self.customers[key] = record
+
+        start, end = message_time_range(log)
+        record['sessions'][f"{date_str}/{session_id}"] = {
+            "id": session_id,
+            "date": date_str,
+            "start": start,
+            "end": end,
+            "orders": orders,
+            "links": links,
+            "risks": risks,
+            "dismissed": bool(analysis) and analysis.get('review_status') == 'approved',
+        }
+        _recompute(record)
+        self._index(key, record)
+        self._ranking = None
+        return key, record
+
+    def get(self, key):
+        return self.customers.get(key)
+
+    def has_session(self, session_id):
+        return str(session_id) in self._session_index
+
+    def find(self, key_or_id):
+        """按客户标识、会话 ID 或订单号查找"""
+        record = self.customers.get(key_or_id)
+        if record is None:
+            key = self._session_index.get(key_or_id) or self._link_index.get(f"order:{key_or_id}")
+            record = self.customers.get(key) if key else None
+        return record
+
+    def top(self, n=20):
+        """按风险天数、累计用户风险数排名的前 N 个客户 (不含逐会话明细)"""
+        if self._ranking is None:
+            self._ranking = sorted(
+                self.customers,
+                key=lambda k: (self.customers[k]['risk_days'], self.customers[k]['risk_total'],
+                               self.customers[k]['last_contact']),
+                reverse=True
+            )
+        return [summarize(key, self.customers[key]) for key in self._ranking[:n]]
+
+def summarize(key, record):
+    """去掉逐会话明细，用于列表展示"""
+    summary = {k: v for k, v in record.items() if k != 'sessions'}
+    summary['key'] = key
+    return summary
+
+# ================= 全量重建 =================
+
+def rebuild(result_folder=RESULT_FOLDER, path=ROLLUP_FILE):
+    """
+    从已有的 processed_result 按日期顺序重建汇总 (会计入人工审核结果)
+    只重写汇总文件，不会修改各天结果中的 repeat_customer 标记
+    """
+    rollup = CustomerRollup(path)
+    for file_path in sorted(Path(result_folder).glob("????-??-??.json")):
+        for session in load_sessions(file_path):
+            rollup.update(session, file_path.stem)
+    rollup.save()
+    return rollup
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="客户累计风险汇总")
+    parser.add_argument("--rebuild", action="store_true", help="从 processed_result 全量重建")
+    parser.add_argument("--top", type=int, default=10, help="显示前 N 个客户")
+    args = parser.parse_args()
+
+    rollup = rebuild() if args.rebuild else CustomerRollup.load()
+    print(f"客户数: {len(rollup.customers)} "
+          f"(可按订单号识别: {sum(1 for r in rollup.customers.values() if r['identified'])})")
+    for item in rollup.top(args.top):
+        flag = " [重复投诉]" if item['repeat'] else ""
+        print(f"  {item['key']} 会话{item['session_count']} 风险{item['risk_total']} 天数{item['risk_days']} "
+              f"趋势{item['trend']} 首次{item['first_contact']} 最近{item['last_contact']}{flag} {item['labels']}")
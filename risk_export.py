@@ -0,0 +1,218 @@
+import argparse
+import csv
+import glob
+import io
+import os
+import re
+import sys
+import tempfile
+
+from chat_model import Checkpoint, load_sessions
+
+# ================= 配置区域 =================
+DATA_DIR = os.path.join('source', 'processed_result')
+
+# CSV 每攒够多少行输出一次
+CSV_CHUNK_ROWS = 500
+# XLSX 临时文件按块读取的大小
+XLSX_CHUNK_BYTES = 64 * 1024
+
+EXPORT_COLUMNS = ["id", "customer_name", "date", "score",
+                  "checkpoint_type", "checkpoint_reason", "checkpoint_text", "review_status"]
+CONTEXT_COLUMN = "context"
+
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# ================= 数据遍历 =================
+
+def is_valid_date(value):
+    return bool(value) and _DATE_RE.fullmatch(value) is not None
+
+def list_dates(start=None, end=None, data_dir=DATA_DIR):
+    """返回 [start, end] 区间内有数据文件的日期 (升序)，缺省表示不限"""
+    dates = []
+    for f in glob.glob(os.path.join(data_dir, "????-??-??.json")):
+        date_str = os.path.basename(f).replace('.json', '')
+        if start and date_str < start:
+            continue
+        if end and date_str > end:
+            continue
+        dates.append(date_str)
+    dates.sort()
+    return dates
+
+def format_context(log, index, radius):
+    """截取 index 前后各 radius 条消息，命中的那条用 >> 标记"""
+    lines = []
+    for i in range(max(0, index - radius), min(len(log), index + radius + 1)):
+        msg = log.message(i)
+        if not isinstance(msg, dict):
+            continue
+        mark = ">>" if i == index else "  "
+        lines.append(f"{mark} [{msg.get('time', '')}] {msg.get('sender', '')}: {msg.get('content', '')}")
+    return "\n".join(lines)
+
+def iter_export_rows(dates, data_dir=DATA_DIR, types=None, statuses=None,
+                     customer=None, max_score=None, include_all=False, context=0):
+    """
+    逐天读取并逐行产出风险点 (每个 checkpoint 一行)，同一时刻只有一天的数据在内存中
+    - types: 只保留这些风险类型；指定后没有对应类型风险点的会话 (包括无风险点的会话) 不输出
+    - statuses: 只保留这些审核状态，未审核用 'none' 表示
+    - customer: 客户名包含该字符串
+    - max_score: 分数不高于该值
+    - include_all: 为 True 时无风险点的会话也输出一行 (与 types 同时指定时以 types 为准)
+    - context: 大于 0 时附加命中消息前后各 N 条作为上下文
+    """
+    for date_str in dates:
+        sessions = load_sessions(os.path.join(data_dir, f"{date_str}.json"))
+        for session in sessions:
+            analysis = session.get('ai_analysis') or {}
+            checkpoints = []
+            for cp in analysis.get('checkpoints') or []:
+                if isinstance(cp, Checkpoint):
+                    cp_type = cp.type
+                else:
+                    cp_type = cp.get('type', '') if isinstance(cp, dict) else ''
+                if types and cp_type not in types:
+                    continue
+                checkpoints.append(cp)
+            # 类型过滤先于 include_all：指定类型时只输出命中该类型的会话
+            if not checkpoints and (types or not include_all):
+                continue
+
+            status = analysis.get('review_status') or ''
+            if statuses and (status or 'none') not in statuses:
+                continue
+            customer_name = session.get('customer_name', '')
+            if customer and customer not in str(customer_name):
+                continue
+            score = analysis.get('score', '')
+            if max_score is not None and not (isinstance(score, (int, float)) and score <= max_score):
+                continue
+
+            base = [session.get('id', ''), customer_name, date_str, score]
+            log = session.get('messages')
+
+            if not checkpoints:
+                row = base + ['', '', '', status]
+                if context:
+                    row.append('')
+                yield row
+                continue
+
+            for cp in checkpoints:
+                if isinstance(cp, Checkpoint):
+                    cp_type, reason, text, index = cp.type, cp.reason, cp.get_text(log), cp.index
+                else:
+                    cp_type, reason, text, index = cp.get('type', ''), cp.get('reason', ''), cp.get('text', ''), -1
+                row = base + [cp_type, reason, text, status]
+                if context:
+                    row.append(format_context(log, index, context) if index >= 0 else '')
+                yield row
+
+def export_columns(context=0):
+    return EXPORT_COLUMNS + [CONTEXT_COLUMN] if context else list(EXPORT_COLUMNS)
+
+# ================= 输出格式 =================
+
+# 以这些字符开头的单元格会被 Excel 当作公式执行 (CSV/公式注入)
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def escape_cell(value):
+    """聊天原文可能以 = + - @ 开头，加 ' 前缀使其按文本显示"""
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def iter_csv(rows, columns):
+    """把行生成器转换为 CSV 文本块生成器 (带 BOM，Excel 直接打开不乱码)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow([escape_cell(v) for v in row])
+        pending += 1
+        if pending >= CSV_CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+def iter_xlsx(rows, columns):
+    """
+    以 openpyxl write_only 模式写入临时文件，再按块读出
+    openpyxl 为可选依赖，未安装时在调用时立即抛出 ImportError
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ImportError("导出 XLSX 需要安装 openpyxl (pip install openpyxl)")
+
+    def generate():
+        with tempfile.TemporaryFile() as tmp:
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("风险报告")
+            ws.append(columns)
+            for row in rows:
+                ws.append([escape_cell(v) for v in row])
+            wb.save(tmp)
+            tmp.seek(0)
+            while True:
+                chunk = tmp.read(XLSX_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+
+    return generate()
+
+# ================= 命令行入口 =================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导出风险报告 (CSV/XLSX)")
+    parser.add_argument("--start", help="开始日期 YYYY-MM-DD (含)")
+    parser.add_argument("--end", help="结束日期 YYYY-MM-DD (含)")
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    parser.add_argument("--type", action="append", dest="types", help="风险类型，可重复")
+    parser.add_argument("--status", action="append", dest="statuses",
+                        help="审核状态 (pending/confirmed/approved/rejected/none)，可重复")
+    parser.add_argument("--customer", help="客户名包含")
+    parser.add_argument("--max-score", type=int, help="分数不高于")
+    parser.add_argument("--all", action="store_true", dest="include_all", help="包含无风险点的会话 (与 --type 同时指定时以 --type 为准)")
+    parser.add_argument("--context", type=int, default=0, help="附加命中消息前后 N 条上下文")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("-o", "--output", help="输出文件，CSV 缺省输出到标准输出")
+    args = parser.parse_args(argv)
+
+    for value in (args.start, args.end):
+        if value and not is_valid_date(value):
+            parser.error(f"日期格式错误: {value}")
+    if args.format == "xlsx" and not args.output:
+        parser.error("XLSX 导出需要指定 -o/--output")
+
+    dates = list_dates(args.start, args.end, args.data_dir)
+    columns = export_columns(args.context)
+    rows = iter_export_rows(dates, args.data_dir, types=args.types, statuses=args.statuses,
+                            customer=args.customer, max_score=args.max_score,
+                            include_all=args.include_all, context=args.context)
+
+    if args.format == "xlsx":
+        chunks = iter_xlsx(rows, columns)
+        with open(args.output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            for chunk in iter_csv(rows, columns):
+                f.write(chunk)
+    else:
+        sys.stdout.reconfigure(encoding='utf-8')
+        for chunk in iter_csv(rows, columns):
+            sys.stdout.write(chunk)
+
+    print(f"已导出 {len(dates)} 天的数据", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
 import json
 import os
 import sys
 import glob
 
+from chat_model import load_sessions, dump_sessions
+import risk_export
+from customer_rollup import ROLLUP_FILE, CustomerRollup
+
 # 解决控制台中文乱码问题
 sys.stdout.reconfigure(encoding='utf-8')
 
@@ -25,6 +29,31 @@ if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
     print(f"提示: 已自动创建数据文件夹 '{DATA_DIR}'，请将 JSON 文件放入其中。")
 
+# 已加载日期的会话缓存 (紧凑模型)：date -> (文件修改时间, sessions)
+_SESSION_CACHE = {}
+
+def load_day(target_date):
+    """读取某天的会话，文件未变化时直接复用内存中的紧凑模型"""
+    file_path = os.path.join(DATA_DIR, f"{target_date}.json")
+    mtime = os.stat(file_path).st_mtime_ns
+    cached = _SESSION_CACHE.get(target_date)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    sessions = load_sessions(file_path)
+    _SESSION_CACHE[target_date] = (mtime, sessions)
+    return sessions
+
+# 客户汇总缓存：(文件修改时间, CustomerRollup)，分析脚本更新文件后自动重新加载
+_ROLLUP_CACHE = [None, None]
+
+def load_rollup():
+    """读取客户累计汇总，文件未变化时复用内存中的实例 (排名缓存随之保留)"""
+    mtime = os.stat(ROLLUP_FILE).st_mtime_ns if os.path.exists(ROLLUP_FILE) else None
+    if _ROLLUP_CACHE[1] is None or _ROLLUP_CACHE[0] != mtime:
+        _ROLLUP_CACHE[0] = mtime
+        _ROLLUP_CACHE[1] = CustomerRollup.load(ROLLUP_FILE)
+    return _ROLLUP_CACHE[1]
+
 # ================= 路由定义 =================
 
 @app.route('/')
@@ -76,9 +105,8 @@ def get_sessions():
         return jsonify([]) # 如果该日期没文件，返回空数组
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return jsonify(data)
+        sessions = load_day(target_date)
+        return jsonify([s.to_dict() for s in sessions])
     except json.JSONDecodeError:
         print(f"❌ 读取 {target_date} 失败: JSON 格式错误")
         return jsonify([])
@@ -108,15 +136,16 @@ def update_review():
             return jsonify({"status": "error", "msg": "该日期文件不存在"}), 404
 
         # 读取现有数据
-        with open(file_path, 'r', encoding='utf-8') as f:
-            all_data = json.load(f)
+        all_data = load_day(target_date)
         
         found = False
+        target_item = None
         # 遍历查找对应的 session ID
         for item in all_data:
             # 转换为字符串比较，防止一个是 int 一个是 string
             if str(item.get('id')) == str(session_id):
                 found = True
+                target_item = item
                 # 确保 ai_analysis 字段存在
                 if 'ai_analysis' not in item:
                     item['ai_analysis'] = {}
@@ -153,17 +182,95 @@ def update_review():
                 break
         
         if found:
-            # 写入回文件
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(all_data, f, ensure_ascii=False, indent=2)
+            # 写入回文件，并同步缓存中的修改时间
+            dump_sessions(all_data, file_path)
+            _SESSION_CACHE[target_date] = (os.stat(file_path).st_mtime_ns, all_data)
+
+            # 审核结果 (如误报 approved) 同步到客户汇总，只更新这一个会话的贡献
+            rollup = load_rollup()
+            if rollup.has_session(target_item.get('id')):
+                rollup.update(target_item, target_date)
+                rollup.save()
+                _ROLLUP_CACHE[0] = os.stat(ROLLUP_FILE).st_mtime_ns
             return jsonify({"status": "success", "msg": "保存成功"})
         else:
             return jsonify({"status": "error", "msg": "ID未找到"}), 404
 
     except Exception as e:
+        # 内存中的数据可能已被修改，丢弃缓存以磁盘文件为准
+        _SESSION_CACHE.clear()
         print(f"❌ 写入错误: {e}")
         return jsonify({"status": "error", "msg": str(e)}), 500
 
+# 🆕 接口：按日期区间流式导出风险报告 (CSV / XLSX)
+# 参数：start / end (YYYY-MM-DD)、format=csv|xlsx、type、status (可重复或逗号分隔)、
+#       customer、max_score、all=1 (含无风险会话，与 type 同时指定时以 type 为准)、context=N (附加前后 N 条消息)
+@app.route('/api/export', methods=['GET'])
+def export_report():
+    def multi(name):
+        values = []
+        for raw in request.args.getlist(name):
+            values.extend(v.strip() for v in raw.split(',') if v.strip())
+        return values or None
+
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    fmt = request.args.get('format', 'csv')
+    for value in (start, end):
+        if value and not risk_export.is_valid_date(value):
+            return jsonify({"status": "error", "msg": f"日期格式错误: {value}"}), 400
+    if fmt not in ('csv', 'xlsx'):
+        return jsonify({"status": "error", "msg": "format 仅支持 csv / xlsx"}), 400
+    # type=int 解析失败时回落到默认值
+    max_score = request.args.get('max_score', type=int)
+    context = max(0, request.args.get('context', 0, type=int))
+
+    # 数据直接从磁盘逐天读取，不进入 _SESSION_CACHE，内存占用与天数无关
+    dates = risk_export.list_dates(start, end, DATA_DIR)
+    columns = risk_export.export_columns(context)
+    rows = risk_export.iter_export_rows(
+        dates, DATA_DIR,
+        types=multi('type'),
+        statuses=multi('status'),
+        customer=request.args.get('customer') or None,
+        max_score=max_score,
+        include_all=request.args.get('all') == '1',
+        context=context
+    )
+
+    filename = f"risk_report_{start or 'begin'}_{end or 'latest'}.{fmt}"
+    if fmt == 'xlsx':
+        try:
+            chunks = risk_export.iter_xlsx(rows, columns)
+        except ImportError as e:
+            return jsonify({"status": "error", "msg": str(e)}), 501
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        chunks = risk_export.iter_csv(rows, columns)
+        mimetype = 'text/csv'
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# 🆕 接口：客户累计风险汇总
+# ?key=<客户标识 (订单:<订单号> 或会话ID) / 任一会话ID / 订单号> 查询单个客户 (含逐会话明细)；
+# 否则返回前 top 名 (默认 20)
+@app.route('/api/customers', methods=['GET'])
+def get_customers():
+    rollup = load_rollup()
+    key = request.args.get('key')
+    if key:
+        record = rollup.find(key)
+        if record is None:
+            return jsonify({"status": "error", "msg": "客户未找到"}), 404
+        return jsonify(record)
+
+    top = max(1, request.args.get('top', 20, type=int))
+    return jsonify({"total": len(rollup.customers), "customers": rollup.top(top)})
+
 if __name__ == '__main__':
     print(f">>> 服务已启动")
     print(f">>> 数据目录: {os.path.abspath(DATA_DIR)}")